@@ -4,13 +4,13 @@
 
 use clap::{Parser, Subcommand};
 use anyhow::{Result, Context, bail};
-use tracing::info;
+use tracing::{error, info};
 use std::fs::File;
 use std::io::{BufReader, Read};
 use std::path::Path;
 
-use diskann_impl::IndexBuilder;
-use diskann_traits::{distance::EuclideanDistance, index::Index, search::Search};
+use diskann_impl::{IndexBuilder, VamanaIndex};
+use diskann_traits::{distance::EuclideanDistance, index::Index, search::{Search, SearchResult}};
 use diskann_io::{write_vectors_f32, read_vectors_f32};
 
 #[derive(Parser)]
@@ -48,7 +48,7 @@ enum Commands {
         /// Index file path
         #[arg(short, long)]
         index: String,
-        /// Query vector file path
+        /// Query vector file path ("-" to read from stdin)
         #[arg(short, long)]
         query: String,
         /// Number of nearest neighbors to find
@@ -60,12 +60,41 @@ enum Commands {
         /// Output results to file (optional)
         #[arg(short, long)]
         output: Option<String>,
+        /// Treat the query file as a vector file ([num_queries][dimension][f32...])
+        /// and search every query it contains in a single run
+        #[arg(long)]
+        batch: bool,
+        /// Write results to stdout as binary records instead of text:
+        /// per query [count: u32][(id: u32, distance: f32) * count]
+        #[arg(long)]
+        binary_output: bool,
+    },
+    /// Load an index once and answer binary search requests over stdin/stdout
+    ///
+    /// Request:  [k: u32][beam: u32][dimension: u32][query: f32 * dimension]
+    /// Response: [count: u32][(id: u32, distance: f32) * count]
+    ///
+    /// A request beam of 0 uses --beam. A request with k = 0, or end of
+    /// input, shuts the server down. Setting the top bit of the dimension
+    /// field sends the query as IEEE f16 instead of f32, halving its size.
+    /// A request whose dimension differs from the index's stops the server
+    /// with an error.
+    Serve {
+        /// Index file path
+        #[arg(short, long)]
+        index: String,
+        /// Default beam width for requests that don't set one
+        #[arg(long, default_value_t = 64)]
+        beam: usize,
     },
 }
 
-/// Load vectors from a binary file using diskann-io format
-/// Expected format: [num_vectors: u32][dimension: u32][vector_data: f32...]
-fn load_vectors_from_file(file_path: &str) -> Result<Vec<(u32, Vec<f32>)>> {
+/// Open a file for buffered reading, where "-" means stdin
+fn open_input(file_path: &str) -> Result<Box<dyn Read>> {
+    if file_path == "-" {
+        return Ok(Box::new(BufReader::new(std::io::stdin())));
+    }
+
     let path = Path::new(file_path);
     if !path.exists() {
         bail!("File not found: {}", file_path);
@@ -73,7 +102,13 @@ fn load_vectors_from_file(file_path: &str) -> Result<Vec<(u32, Vec<f32>)>> {
 
     let file = File::open(path)
         .with_context(|| format!("Failed to open file: {}", file_path))?;
-    let mut reader = BufReader::new(file);
+    Ok(Box::new(BufReader::new(file)))
+}
+
+/// Load vectors from a binary file using diskann-io format
+/// Expected format: [num_vectors: u32][dimension: u32][vector_data: f32...]
+fn load_vectors_from_file(file_path: &str) -> Result<Vec<(u32, Vec<f32>)>> {
+    let mut reader = open_input(file_path)?;
 
     // Use diskann-io to read vectors
     let vectors = read_vectors_f32(&mut reader)
@@ -95,14 +130,7 @@ fn load_vectors_from_file(file_path: &str) -> Result<Vec<(u32, Vec<f32>)>> {
 /// Load a single query vector from file
 /// Expected format: [dimension: u32][vector_data: f32...]
 fn load_query_from_file(file_path: &str) -> Result<Vec<f32>> {
-    let path = Path::new(file_path);
-    if !path.exists() {
-        bail!("File not found: {}", file_path);
-    }
-
-    let file = File::open(path)
-        .with_context(|| format!("Failed to open query file: {}", file_path))?;
-    let mut reader = BufReader::new(file);
+    let mut reader = open_input(file_path)?;
 
     // Read dimension
     let mut buffer = [0u8; 4];
@@ -122,17 +150,192 @@ fn load_query_from_file(file_path: &str) -> Result<Vec<f32>> {
     Ok(query)
 }
 
+/// Load an index file, or build a small demo index if the file doesn't exist
+///
+/// Returns the index together with its vector dimension.
+fn load_index(index_path: &str) -> Result<(VamanaIndex<EuclideanDistance>, usize)> {
+    if Path::new(index_path).exists() {
+        info!("Loading index from {}", index_path);
+        let index_file = File::open(index_path)
+            .with_context(|| format!("Failed to open index file: {}", index_path))?;
+        let mut reader = BufReader::new(index_file);
+        
+        // Load vectors and rebuild index
+        let loaded_vectors = read_vectors_f32(&mut reader)
+            .context("Failed to load vectors from index file")?;
+        
+        info!("Loaded {} vectors from index", loaded_vectors.len());
+        let dimension = loaded_vectors.first().map_or(0, |vector| vector.len());
+        
+        let distance_fn = EuclideanDistance;
+        let vector_data: Vec<(u32, Vec<f32>)> = loaded_vectors
+            .into_iter()
+            .enumerate()
+            .map(|(i, v)| (i as u32, v))
+            .collect();
+        
+        let index = IndexBuilder::new(distance_fn)
+            .max_degree(64)
+            .search_list_size(128)
+            .build(vector_data)
+            .context("Failed to rebuild index from loaded vectors")?;
+        Ok((index, dimension))
+    } else {
+        // Create demo index if file doesn't exist
+        info!("Index file not found, creating demo index for testing");
+        let distance_fn = EuclideanDistance;
+        let demo_vectors = vec![
+            (0, vec![1.0, 0.0, 0.0]),
+            (1, vec![0.0, 1.0, 0.0]),
+            (2, vec![0.0, 0.0, 1.0]),
+            (3, vec![0.5, 0.5, 0.0]),
+            (4, vec![0.0, 0.5, 0.5]),
+        ];
+
+        let index = IndexBuilder::new(distance_fn)
+            .max_degree(32)
+            .search_list_size(64)
+            .build(demo_vectors)
+            .context("Failed to create demo index")?;
+        Ok((index, 3))
+    }
+}
+
+/// Write up to k results as [count: u32][(id: u32, distance: f32) * count]
+fn write_binary_results<W: std::io::Write>(
+    writer: &mut W,
+    results: &[SearchResult],
+    k: usize,
+) -> Result<()> {
+    let count = results.len().min(k);
+    writer.write_all(&(count as u32).to_le_bytes())?;
+    for result in &results[..count] {
+        writer.write_all(&result.id.to_le_bytes())?;
+        writer.write_all(&result.distance.to_le_bytes())?;
+    }
+    Ok(())
+}
+
+/// Dimension-field bit marking a serve request whose query elements are f16
+const QUERY_F16_FLAG: u32 = 1 << 31;
+
+/// Widen an IEEE 754 half-precision value to f32 (exactly; every f16 is representable)
+fn f16_to_f32(bits: u16) -> f32 {
+    let sign = u32::from(bits & 0x8000) << 16;
+    let exponent = u32::from((bits >> 10) & 0x1f);
+    let mantissa = u32::from(bits & 0x03ff);
+
+    match exponent {
+        // Zero or subnormal: mantissa * 2^-24
+        0 => {
+            let magnitude = mantissa as f32 * f32::from_bits(0x3380_0000);
+            if sign != 0 { -magnitude } else { magnitude }
+        }
+        // Infinity or NaN
+        0x1f => f32::from_bits(sign | 0x7f80_0000 | (mantissa << 13)),
+        // Normal: rebias the exponent from 15 to 127
+        _ => f32::from_bits(sign | ((exponent + 112) << 23) | (mantissa << 13)),
+    }
+}
+
+/// Answer search requests from stdin until EOF or a request with k = 0
+///
+/// Requests whose dimension doesn't match the index are rejected with an
+/// error rather than answered with meaningless distances.
+fn serve(
+    index: &VamanaIndex<EuclideanDistance>,
+    index_dimension: usize,
+    default_beam: usize,
+) -> Result<()> {
+    use std::io::{BufWriter, ErrorKind, Write};
+
+    let stdin = std::io::stdin();
+    let mut reader = BufReader::new(stdin.lock());
+    let stdout = std::io::stdout();
+    let mut writer = BufWriter::new(stdout.lock());
+
+    let mut header = [0u8; 12];
+    let mut payload = Vec::new();
+    let mut query = Vec::new();
+    let mut served = 0usize;
+
+    loop {
+        match reader.read_exact(&mut header) {
+            Ok(()) => {}
+            Err(e) if e.kind() == ErrorKind::UnexpectedEof => break,
+            Err(e) => return Err(e).context("Failed to read request header"),
+        }
+        let k = u32::from_le_bytes([header[0], header[1], header[2], header[3]]) as usize;
+        let beam = u32::from_le_bytes([header[4], header[5], header[6], header[7]]) as usize;
+        let dimension = u32::from_le_bytes([header[8], header[9], header[10], header[11]]);
+        let half = dimension & QUERY_F16_FLAG != 0;
+        let dimension = (dimension & !QUERY_F16_FLAG) as usize;
+        if k == 0 {
+            break;
+        }
+        if dimension != index_dimension {
+            // Also guards the payload allocation against a corrupt header
+            error!(
+                "Rejecting request with dimension {} for an index of dimension {}",
+                dimension, index_dimension
+            );
+            bail!(
+                "Query dimension {} does not match index dimension {}",
+                dimension, index_dimension
+            );
+        }
+        let beam = if beam == 0 { default_beam } else { beam };
+
+        payload.resize(dimension * if half { 2 } else { 4 }, 0u8);
+        reader.read_exact(&mut payload)
+            .context("Failed to read query vector")?;
+        query.clear();
+        if half {
+            query.extend(
+                payload
+                    .chunks_exact(2)
+                    .map(|bytes| f16_to_f32(u16::from_le_bytes([bytes[0], bytes[1]]))),
+            );
+        } else {
+            query.extend(
+                payload
+                    .chunks_exact(4)
+                    .map(|bytes| f32::from_le_bytes([bytes[0], bytes[1], bytes[2], bytes[3]])),
+            );
+        }
+
+        let results = index.search_with_beam(&query, k, beam)
+            .context("Search failed")?;
+        write_binary_results(&mut writer, &results, k)?;
+        writer.flush()?;
+        served += 1;
+    }
+
+    info!("Served {} queries", served);
+    Ok(())
+}
+
 /// Save search results to file
-fn save_results(results: &[(u32, f32)], output_path: &str) -> Result<()> {
+///
+/// Each result is `(query_index, id, distance)`; the query column is only
+/// written for batch searches.
+fn save_results(results: &[(usize, u32, f32)], batch: bool, output_path: &str) -> Result<()> {
     use std::io::Write;
     
     let file = File::create(output_path)
         .with_context(|| format!("Failed to create output file: {}", output_path))?;
     let mut writer = std::io::BufWriter::new(file);
 
-    writeln!(writer, "id,distance")?;
-    for (id, distance) in results {
-        writeln!(writer, "{},{}", id, distance)?;
+    if batch {
+        writeln!(writer, "query,id,distance")?;
+        for (query, id, distance) in results {
+            writeln!(writer, "{},{},{}", query, id, distance)?;
+        }
+    } else {
+        writeln!(writer, "id,distance")?;
+        for (_, id, distance) in results {
+            writeln!(writer, "{},{}", id, distance)?;
+        }
     }
 
     writer.flush()?;
@@ -140,7 +343,10 @@ fn save_results(results: &[(u32, f32)], output_path: &str) -> Result<()> {
 }
 
 fn main() -> Result<()> {
-    tracing_subscriber::fmt::init();
+    // Log to stderr so stdout carries only results (and the serve protocol)
+    tracing_subscriber::fmt()
+        .with_writer(std::io::stderr)
+        .init();
     
     let cli = Cli::parse();
     
@@ -200,86 +406,114 @@ fn main() -> Result<()> {
             k, 
             beam,
             output,
+            batch,
+            binary_output,
         } => {
+            use std::io::Write;
+
             info!("Searching index {} with query {} for {} neighbors (beam={})", 
                   index_path, query_path, k, beam);
 
             // Load index from file
-            let index = if Path::new(&index_path).exists() {
-                info!("Loading index from {}", index_path);
-                let index_file = File::open(&index_path)
-                    .with_context(|| format!("Failed to open index file: {}", index_path))?;
-                let mut reader = BufReader::new(index_file);
-                
-                // Load vectors and rebuild index
-                let loaded_vectors = read_vectors_f32(&mut reader)
-                    .context("Failed to load vectors from index file")?;
-                
-                info!("Loaded {} vectors from index", loaded_vectors.len());
-                
-                let distance_fn = EuclideanDistance;
-                let vector_data: Vec<(u32, Vec<f32>)> = loaded_vectors
+            let (index, _) = load_index(&index_path)?;
+
+            // Load queries
+            let queries: Vec<Vec<f32>> = if batch {
+                load_vectors_from_file(&query_path)
+                    .context("Failed to load query vectors")?
                     .into_iter()
-                    .enumerate()
-                    .map(|(i, v)| (i as u32, v))
-                    .collect();
-                
-                IndexBuilder::new(distance_fn)
-                    .max_degree(64)
-                    .search_list_size(128)
-                    .build(vector_data)
-                    .context("Failed to rebuild index from loaded vectors")?
+                    .map(|(_, query)| query)
+                    .collect()
             } else {
-                // Create demo index if file doesn't exist
-                info!("Index file not found, creating demo index for testing");
-                let distance_fn = EuclideanDistance;
-                let demo_vectors = vec![
-                    (0, vec![1.0, 0.0, 0.0]),
-                    (1, vec![0.0, 1.0, 0.0]),
-                    (2, vec![0.0, 0.0, 1.0]),
-                    (3, vec![0.5, 0.5, 0.0]),
-                    (4, vec![0.0, 0.5, 0.5]),
-                ];
-
-                IndexBuilder::new(distance_fn)
-                    .max_degree(32)
-                    .search_list_size(64)
-                    .build(demo_vectors)
-                    .context("Failed to create demo index")?
+                vec![load_query_from_file(&query_path)
+                    .context("Failed to load query vector")?]
             };
-
-            // Load query
-            let query = load_query_from_file(&query_path)
-                .context("Failed to load query vector")?;
             
-            info!("Loaded query vector of dimension {}", query.len());
-
-            // Perform search
-            let results = index.search_with_beam(&query, k, beam)
-                .context("Search failed")?;
-
-            // Display results
-            println!("Search Results:");
-            println!("ID\tDistance");
-            let mut result_pairs = Vec::new();
-            for (i, result) in results.iter().enumerate() {
-                println!("{}\t{:.6}", result.id, result.distance);
-                result_pairs.push((result.id, result.distance));
-                if i >= k - 1 {
-                    break;
+            info!("Loaded {} query vector(s)", queries.len());
+
+            // Perform searches and write results to stdout
+            let stdout = std::io::stdout();
+            let mut out = std::io::BufWriter::new(stdout.lock());
+            let mut result_rows = Vec::new();
+            for (query_index, query) in queries.iter().enumerate() {
+                let results = index.search_with_beam(query, k, beam)
+                    .context("Search failed")?;
+
+                if binary_output {
+                    write_binary_results(&mut out, &results, k)?;
+                } else {
+                    if batch {
+                        writeln!(out, "Query {}:", query_index)?;
+                    } else {
+                        writeln!(out, "Search Results:")?;
+                    }
+                    writeln!(out, "ID\tDistance")?;
+                    for result in results.iter().take(k) {
+                        writeln!(out, "{}\t{:.6}", result.id, result.distance)?;
+                    }
                 }
+                result_rows.extend(
+                    results.iter().take(k).map(|result| (query_index, result.id, result.distance)),
+                );
             }
+            out.flush()?;
 
             // Save results if output specified
             if let Some(output_path) = output {
-                save_results(&result_pairs, &output_path)
+                save_results(&result_rows, batch, &output_path)
                     .context("Failed to save results")?;
                 info!("Results saved to {}", output_path);
             }
 
             info!("Search completed successfully");
         }
+        Commands::Serve {
+            index: index_path,
+            beam,
+        } => {
+            let (index, dimension) = load_index(&index_path)?;
+            info!("Serving searches on {} (default beam={})", index_path, beam);
+            serve(&index, dimension, beam)?;
+        }
     }
     
     Ok(())
-}
\ No newline at end of file
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_f16_to_f32_zero() {
+        assert_eq!(f16_to_f32(0x0000).to_bits(), 0.0f32.to_bits());
+        assert_eq!(f16_to_f32(0x8000).to_bits(), (-0.0f32).to_bits());
+    }
+
+    #[test]
+    fn test_f16_to_f32_normal() {
+        assert_eq!(f16_to_f32(0x3c00), 1.0);
+        assert_eq!(f16_to_f32(0xc000), -2.0);
+        assert_eq!(f16_to_f32(0x3555), 0.333_251_95);
+        // Smallest normal and largest finite value
+        assert_eq!(f16_to_f32(0x0400), 6.103_515_6e-5);
+        assert_eq!(f16_to_f32(0x7bff), 65504.0);
+        assert_eq!(f16_to_f32(0xfbff), -65504.0);
+    }
+
+    #[test]
+    fn test_f16_to_f32_subnormal() {
+        // Smallest and largest subnormals: 2^-24 and 1023 * 2^-24
+        assert_eq!(f16_to_f32(0x0001), 2.0f32.powi(-24));
+        assert_eq!(f16_to_f32(0x03ff), 1023.0 * 2.0f32.powi(-24));
+        assert_eq!(f16_to_f32(0x8001), -(2.0f32.powi(-24)));
+    }
+
+    #[test]
+    fn test_f16_to_f32_infinity_and_nan() {
+        assert_eq!(f16_to_f32(0x7c00), f32::INFINITY);
+        assert_eq!(f16_to_f32(0xfc00), f32::NEG_INFINITY);
+        assert!(f16_to_f32(0x7e00).is_nan());
+        assert!(f16_to_f32(0xfc01).is_nan());
+    }
+}
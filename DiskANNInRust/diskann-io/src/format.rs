@@ -99,12 +99,15 @@ pub fn write_vectors_f32<W: Write>(
     header.write_to(writer)
         .context("Failed to write binary header")?;
     
-    // Write vector data
+    // Write vector data, one write per vector through a reused byte buffer
+    let mut row_bytes = Vec::with_capacity(num_dimensions * 4);
     for vector in vectors {
+        row_bytes.clear();
         for &value in vector {
-            writer.write_all(&value.to_le_bytes())
-                .context("Failed to write vector data")?;
+            row_bytes.extend_from_slice(&value.to_le_bytes());
         }
+        writer.write_all(&row_bytes)
+            .context("Failed to write vector data")?;
     }
     
     Ok(header.total_file_size_f32())
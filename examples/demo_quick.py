@@ -4,19 +4,56 @@ Quick demo of the text search functionality using simple synthetic data.
 This script demonstrates the complete pipeline without requiring large downloads.
 """
 
+import functools
 import struct
 import tempfile
 import subprocess
 import os
 from pathlib import Path
 
+import numpy as np
+
+# DiskANN vector file header: [num_vectors: u32][dimension: u32]
+VECTOR_HEADER = struct.Struct('<II')
+# Query file header: [dimension: u32]
+QUERY_HEADER = struct.Struct('<I')
+
+DISKANN_DIR = Path(__file__).parent.parent / "DiskANNInRust"
+
+# Keywords that place a demo passage in a biased topic region
+AI_KEYWORDS = ("machine learning", "artificial intelligence")
+FOOD_KEYWORDS = ("food", "restaurant")
+
+@functools.lru_cache(maxsize=None)
+def diskann_binary() -> Path:
+    """Build the DiskANN CLI once per run and return the release binary path."""
+    cmd = ["cargo", "build", "--release", "--bin", "diskann"]
+    result = subprocess.run(cmd, cwd=DISKANN_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"cargo build failed: {result.stderr}")
+    return DISKANN_DIR / "target" / "release" / "diskann"
+
+def diskann_exec(subcommand, *args, stdin=b''):
+    """Run a DiskANN CLI subcommand directly, without going through cargo.
+    
+    `stdin` is raw bytes fed to the process, e.g. a query for `-q -`;
+    stdout and stderr are returned decoded.
+    """
+    cmd = [str(diskann_binary()), subcommand, *args]
+    result = subprocess.run(cmd, input=stdin, capture_output=True)
+    return subprocess.CompletedProcess(
+        cmd,
+        result.returncode,
+        result.stdout.decode('utf-8', errors='replace'),
+        result.stderr.decode('utf-8', errors='replace')
+    )
+
 def create_demo_embeddings():
     """Create simple demo embeddings and metadata."""
     print("Creating demo embeddings...")
     
     # Simple synthetic 384-dimensional vectors
-    import random
-    random.seed(42)
+    rng = np.random.default_rng(42)
     
     # Sample passages
     passages = [
@@ -28,20 +65,17 @@ def create_demo_embeddings():
     ]
     
     # Generate random vectors (normally these would come from sentence transformers)
-    vectors = []
-    for i in range(len(passages)):
-        vector = [random.gauss(0, 1) for _ in range(384)]
-        # Make similar concepts closer in vector space
-        if "machine learning" in passages[i].lower() or "artificial intelligence" in passages[i].lower():
-            # AI/ML related - bias towards positive values in first dimensions
-            for j in range(50):
-                vector[j] += 2.0
-        elif "food" in passages[i].lower() or "restaurant" in passages[i].lower():
-            # Food related - bias towards positive values in different dimensions  
-            for j in range(50, 100):
-                vector[j] += 2.0
-                
-        vectors.append(vector)
+    vectors = rng.standard_normal((len(passages), 384), dtype=np.float32)
+    
+    # Make similar concepts closer in vector space
+    lowered = [p.lower() for p in passages]
+    ai_mask = np.array([any(kw in text for kw in AI_KEYWORDS) for text in lowered])
+    food_mask = np.array([any(kw in text for kw in FOOD_KEYWORDS) for text in lowered]) & ~ai_mask
+    
+    # AI/ML related - bias towards positive values in first dimensions
+    vectors[ai_mask, :50] += 2.0
+    # Food related - bias towards positive values in different dimensions
+    vectors[food_mask, 50:100] += 2.0
     
     return vectors, passages
 
@@ -53,20 +87,17 @@ def save_demo_data(vectors, passages, output_dir):
     # Save vectors in DiskANN format
     vectors_file = output_dir / "demo_vectors.bin" 
     with open(vectors_file, 'wb') as f:
-        # Header
-        f.write(struct.pack('<I', len(vectors)))  # num_vectors
-        f.write(struct.pack('<I', len(vectors[0])))  # dimension
+        # Header: [num_vectors: u32][dimension: u32]
+        f.write(VECTOR_HEADER.pack(len(vectors), vectors.shape[1]))
         
         # Vectors
-        for vector in vectors:
-            for value in vector:
-                f.write(struct.pack('<f', value))
+        np.ascontiguousarray(vectors, dtype='<f4').tofile(f)
     
     # Save metadata
     metadata_file = output_dir / "demo_metadata.tsv"
-    with open(metadata_file, 'w') as f:
-        for i, passage in enumerate(passages):
-            f.write(f"{i}\t{passage}\n")
+    metadata_file.write_text(
+        ''.join(f"{i}\t{passage}\n" for i, passage in enumerate(passages)), encoding='utf-8'
+    )
     
     print(f"Saved demo data to {output_dir}")
     return str(vectors_file), str(metadata_file)
@@ -75,17 +106,18 @@ def build_index(vectors_file, index_file):
     """Build index using DiskANN CLI."""
     print("Building search index...")
     
-    diskann_dir = Path(__file__).parent.parent / "DiskANNInRust"
-    cmd = [
-        "cargo", "run", "--release", "--bin", "diskann", "--",
-        "build", 
-        "-i", vectors_file,
-        "-o", index_file,
-        "--max-degree", "32",
-        "--search-list-size", "64"
-    ]
+    try:
+        result = diskann_exec(
+            "build",
+            "-i", vectors_file,
+            "-o", index_file,
+            "--max-degree", "32",
+            "--search-list-size", "64"
+        )
+    except RuntimeError as e:
+        print(f"Index building failed: {e}")
+        return False
     
-    result = subprocess.run(cmd, cwd=diskann_dir, capture_output=True, text=True)
     if result.returncode != 0:
         print(f"Index building failed: {result.stderr}")
         return False
@@ -96,38 +128,35 @@ def build_index(vectors_file, index_file):
 def create_query_vector():
     """Create a simple query vector."""
     # Simulate a query about machine learning
-    import random
-    random.seed(123)  # Different seed for query
+    rng = np.random.default_rng(123)  # Different seed for query
     
-    vector = [random.gauss(0, 1) for _ in range(384)]
+    vector = rng.standard_normal(384, dtype=np.float32)
     # Bias towards AI/ML dimensions to match the pattern
-    for j in range(50):
-        vector[j] += 1.5
-        
+    vector[:50] += 1.5
+    
     return vector
 
-def save_query(vector, query_file):
-    """Save query vector."""
-    with open(query_file, 'wb') as f:
-        f.write(struct.pack('<I', len(vector)))  # dimension
-        for value in vector:
-            f.write(struct.pack('<f', value))
+def encode_query(vector):
+    """Serialize a query vector in the CLI's query format."""
+    return QUERY_HEADER.pack(len(vector)) + np.asarray(vector, dtype='<f4').tobytes()
 
-def search_index(index_file, query_file):
-    """Search the index."""
+def search_index(index_file, query_vector):
+    """Search the index, piping the query over stdin rather than through a file."""
     print("Searching index...")
     
-    diskann_dir = Path(__file__).parent.parent / "DiskANNInRust"
-    cmd = [
-        "cargo", "run", "--release", "--bin", "diskann", "--",
-        "search",
-        "-i", index_file,
-        "-q", query_file,
-        "-k", "3",
-        "--beam", "32"
-    ]
+    try:
+        result = diskann_exec(
+            "search",
+            "-i", index_file,
+            "-q", "-",
+            "-k", "3",
+            "--beam", "32",
+            stdin=encode_query(query_vector)
+        )
+    except RuntimeError as e:
+        print(f"Search failed: {e}")
+        return False
     
-    result = subprocess.run(cmd, cwd=diskann_dir, capture_output=True, text=True)
     if result.returncode != 0:
         print(f"Search failed: {result.stderr}")
         return False
@@ -145,7 +174,7 @@ def main():
         
         # 1. Create demo data
         vectors, passages = create_demo_embeddings()
-        vectors_file, metadata_file = save_demo_data(vectors, passages, temp_path)
+        vectors_file, _ = save_demo_data(vectors, passages, temp_path)
         
         # 2. Build index
         index_file = str(temp_path / "demo.index")
@@ -154,19 +183,12 @@ def main():
         
         # 3. Create and search with query
         query_vector = create_query_vector()
-        query_file = str(temp_path / "query.bin")
-        save_query(query_vector, query_file)
-        
-        if not search_index(index_file, query_file):
+        if not search_index(index_file, query_vector):
             return 1
         
-        # 4. Show what the passages actually contain
+        # 4. Show what the passages actually contain (IDs are their positions)
         print("\nDemo passages for reference:")
-        with open(metadata_file, 'r') as f:
-            for line in f:
-                parts = line.strip().split('\t', 1)
-                if len(parts) == 2:
-                    print(f"  {parts[0]}: {parts[1]}")
+        print("\n".join(f"  {i}: {passage}" for i, passage in enumerate(passages)))
         
         print("\n✓ Demo completed successfully!")
         print("This demonstrates the complete text search pipeline:")
@@ -2,109 +2,518 @@
 """
 MS MARCO Passage Dataset Embeddings Generator
 
-This script downloads the MS MARCO Passage TREC-DL 2019 validation split,
+This script streams the MS MARCO Passage TREC-DL 2019 validation split,
 generates embeddings using sentence-transformers/all-MiniLM-L6-v2,
 and outputs two files:
 - msmarco_passages.bin: f32 vectors (dim 384) in binary format
 - msmarco_passages.tsv: <id>\t<raw text> metadata
 
+With --quantize int8 it additionally writes msmarco_passages.int8.bin (same
+header, int8 payload) and msmarco_passages.int8.json with per-dimension scales.
+
 The output format is compatible with the DiskANN-Rust CLI for index building.
 """
 
 import argparse
+import collections
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
+import queue
 import struct
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
+from typing import BinaryIO, Iterable, Iterator, List, Optional, TextIO, Tuple
 
 try:
     import numpy as np
+    import torch
     from datasets import load_dataset
     from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize
     from tqdm import tqdm
 except ImportError as e:
     print(f"Missing dependency: {e}")
     print("Please install required packages:")
-    print("pip install datasets sentence-transformers tqdm numpy")
+    print("pip install datasets sentence-transformers torch tqdm numpy")
     sys.exit(1)
 
 
-def download_msmarco_dataset() -> Tuple[List[str], List[str]]:
-    """Download MS MARCO Passage TREC-DL 2019 validation split."""
-    print("Downloading MS MARCO Passage TREC-DL 2019 validation split...")
+# DiskANN vector file header: [num_vectors: u32][dimension: u32]
+VECTOR_HEADER = struct.Struct('<II')
+
+# Number of passages encoded and written per chunk
+ENCODE_CHUNK_SIZE = 1024
+
+# Maximum number of encoded chunks waiting to be written
+WRITE_QUEUE_SIZE = 4
+
+# Number of rows processed per pass when quantizing
+QUANTIZE_CHUNK_SIZE = 65536
+
+# Buffer size for output files (the default 8 KiB means many small writes)
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Tabs and line breaks in passage text would break the TSV row structure
+TSV_ESCAPE_TABLE = str.maketrans('\t\n\r', '   ')
+
+
+def stream_msmarco_passages(max_passages: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+    """Stream (passage_id, passage_text) pairs from the MS MARCO TREC-DL 2019 validation split."""
+    print("Streaming MS MARCO Passage TREC-DL 2019 validation split...")
     
-    # Load the dataset from HuggingFace
+    # Stream the dataset from HuggingFace instead of materializing the split
     dataset = load_dataset(
         "ms_marco", 
         "v1.1",
         split="validation",
+        streaming=True,
         trust_remote_code=True
     )
     
-    # Extract passages and IDs
-    passages = []
-    passage_ids = []
-    
-    print(f"Processing {len(dataset)} passages...")
-    for i, item in enumerate(tqdm(dataset)):
+    count = 0
+    for i, item in enumerate(dataset):
         # Use the passage text and create a simple ID
-        passage_text = item['passages']['passage_text'][0] if item['passages']['passage_text'] else ""
-        if passage_text.strip():  # Only include non-empty passages
-            passages.append(passage_text.strip())
-            passage_ids.append(str(i))
-    
-    print(f"Collected {len(passages)} valid passages")
-    return passages, passage_ids
-
-
-def generate_embeddings(passages: List[str], model_name: str = "sentence-transformers/all-MiniLM-L6-v2") -> np.ndarray:
-    """Generate embeddings for passages using sentence-transformers."""
-    print(f"Loading model: {model_name}")
-    model = SentenceTransformer(model_name)
-    
-    print("Generating embeddings...")
-    embeddings = model.encode(
-        passages,
-        show_progress_bar=True,
-        convert_to_numpy=True,
-        normalize_embeddings=False  # Keep raw embeddings
-    )
+        texts = item['passages']['passage_text']
+        passage_text = texts[0].strip() if texts else ""
+        if passage_text:  # Only include non-empty passages
+            yield str(i), passage_text
+            count += 1
+            if max_passages and count >= max_passages:
+                return
+
+
+def load_model(
+    model_name: str,
+    device: str,
+    precision: str,
+    max_seq_length: Optional[int] = None
+) -> SentenceTransformer:
+    """Load a model on a device with the given inference precision and truncation length."""
+    model = SentenceTransformer(model_name, device=device)
+    
+    # Reduced-precision inference; embeddings are widened back to f32 on write
+    if precision == "fp16":
+        model.half()
+    elif precision == "bf16":
+        model.to(dtype=torch.bfloat16)
+    
+    # Shorter truncation cuts attention cost on long passages (never raised past the model's limit)
+    if max_seq_length:
+        model.max_seq_length = min(max_seq_length, model.max_seq_length)
+    return model
+
+
+def tokenize_chunk(
+    model: SentenceTransformer,
+    texts: List[str],
+    cache_dir: Path
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Tokenize a chunk of passages, reusing the result cached by a previous run if present.
+    
+    Returns right-padded (input_ids: int32, attention_mask: int8) arrays.
+    """
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode('utf-8'))
+        digest.update(b'\0')
+    cache_path = cache_dir / f"{digest.hexdigest()}.npz"
+    
+    if cache_path.exists():
+        with np.load(cache_path) as cached:
+            return cached['input_ids'], cached['attention_mask']
+    
+    features = model.tokenize(texts)
+    input_ids = features['input_ids'].numpy().astype(np.int32)
+    attention_mask = features['attention_mask'].numpy().astype(np.int8)
+    
+    # Write then rename so an interrupted run never leaves a truncated entry
+    tmp_path = cache_path.with_suffix('.tmp.npz')
+    np.savez(tmp_path, input_ids=input_ids, attention_mask=attention_mask)
+    os.replace(tmp_path, cache_path)
+    return input_ids, attention_mask
+
+
+def encode_tokens(
+    model: SentenceTransformer,
+    input_ids: np.ndarray,
+    attention_mask: np.ndarray,
+    batch_size: int
+) -> np.ndarray:
+    """Run the model's modules (transformer, pooling, ...) on pre-tokenized passages.
     
-    print(f"Generated embeddings shape: {embeddings.shape}")
+    Passages are batched longest first so each batch pads to a similar length
+    (as model.encode does); embeddings are returned in input order.
+    """
+    lengths = attention_mask.sum(axis=1)
+    order = np.argsort(-lengths, kind='stable')
+    embeddings = None
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            # Drop padding columns beyond the longest passage in this batch
+            width = int(lengths[batch[0]])
+            features = {
+                'input_ids': torch.from_numpy(
+                    input_ids[batch, :width].astype(np.int64)
+                ).to(model.device),
+                'attention_mask': torch.from_numpy(
+                    attention_mask[batch, :width].astype(np.int64)
+                ).to(model.device),
+            }
+            output = model(features)['sentence_embedding'].float().cpu().numpy()
+            if embeddings is None:
+                embeddings = np.empty((len(order), output.shape[1]), dtype=np.float32)
+            embeddings[batch] = output
     return embeddings
 
 
-def save_binary_vectors(embeddings: np.ndarray, output_path: str):
-    """Save embeddings in DiskANN binary format."""
-    print(f"Saving binary vectors to {output_path}")
+def normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize each row in place (all-zero rows are left as is)."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+    return embeddings
+
+
+def encode_texts(
+    model: SentenceTransformer,
+    texts: List[str],
+    batch_size: int,
+    token_cache_dir: Optional[Path] = None,
+    normalize: bool = False
+) -> np.ndarray:
+    """Encode one chunk of passages.
+    
+    With a token cache directory, tokenization is loaded from (or saved to) disk
+    and the model is run on the token tensors directly. With normalize, rows
+    are scaled to unit length so Euclidean search ranks by cosine similarity.
+    """
+    if token_cache_dir is not None:
+        input_ids, attention_mask = tokenize_chunk(model, texts, token_cache_dir)
+        embeddings = encode_tokens(model, input_ids, attention_mask, batch_size)
+    else:
+        embeddings = model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=False  # Normalized below in place if requested
+        )
+    if normalize:
+        normalize_rows(embeddings)
+    return embeddings
+
+
+def chunk_passages(passages: Iterable[Tuple[str, str]]) -> Iterator[Tuple[List[str], List[str]]]:
+    """Group (passage_id, passage_text) pairs into (ids, texts) chunks of ENCODE_CHUNK_SIZE."""
+    passages = iter(passages)
+    while True:
+        chunk = list(itertools.islice(passages, ENCODE_CHUNK_SIZE))
+        if not chunk:
+            return
+        passage_ids, texts = map(list, zip(*chunk))
+        yield passage_ids, texts
+
+
+def encode_chunks(
+    model: SentenceTransformer,
+    passages: Iterable[Tuple[str, str]],
+    batch_size: int,
+    token_cache_dir: Optional[Path] = None,
+    normalize: bool = False
+) -> Iterator[Tuple[List[str], List[str], np.ndarray]]:
+    """Encode (passage_id, passage_text) pairs chunk by chunk, yielding (ids, texts, embeddings)."""
+    for passage_ids, texts in chunk_passages(passages):
+        yield passage_ids, texts, encode_texts(model, texts, batch_size, token_cache_dir, normalize)
+
+
+# Per-process encoder for --workers, set up by init_encode_worker
+_worker_state = {}
+
+
+def init_encode_worker(
+    devices: multiprocessing.Queue,
+    threads: Optional[int],
+    model_name: str,
+    precision: str,
+    max_seq_length: Optional[int],
+    batch_size: int,
+    token_cache_dir: Optional[Path],
+    normalize: bool
+):
+    """Load this worker's model once, on the next device from the shared queue."""
+    if threads:
+        torch.set_num_threads(threads)
+    _worker_state.update(
+        model=load_model(model_name, devices.get(), precision, max_seq_length),
+        batch_size=batch_size,
+        token_cache_dir=token_cache_dir,
+        normalize=normalize
+    )
+
+
+def encode_in_worker(texts: List[str]) -> np.ndarray:
+    """Encode one chunk with this worker's model."""
+    return encode_texts(
+        _worker_state['model'],
+        texts,
+        _worker_state['batch_size'],
+        _worker_state['token_cache_dir'],
+        _worker_state['normalize']
+    )
+
+
+def encode_chunks_parallel(
+    passages: Iterable[Tuple[str, str]],
+    workers: int,
+    device: str,
+    model_name: str,
+    precision: str,
+    max_seq_length: Optional[int],
+    batch_size: int,
+    token_cache_dir: Optional[Path] = None,
+    normalize: bool = False
+) -> Iterator[Tuple[List[str], List[str], np.ndarray]]:
+    """Like encode_chunks, but spread chunks over worker processes, yielding them in order.
+    
+    On CUDA, workers are assigned round-robin to the visible GPUs; on CPU, the
+    cores are split between them so torch threads don't oversubscribe.
+    """
+    # CUDA cannot be re-initialized in a forked child
+    ctx = multiprocessing.get_context('spawn')
+    devices = ctx.Queue()
+    if device == "cuda":
+        for worker in range(workers):
+            devices.put(f"cuda:{worker % torch.cuda.device_count()}")
+        threads = None
+    else:
+        for _ in range(workers):
+            devices.put("cpu")
+        threads = max(1, (os.cpu_count() or 1) // workers)
+    
+    with ctx.Pool(
+        workers,
+        initializer=init_encode_worker,
+        initargs=(devices, threads, model_name, precision, max_seq_length, batch_size, token_cache_dir, normalize)
+    ) as pool:
+        # Keep a couple of chunks per worker in flight rather than reading the whole stream ahead
+        pending = collections.deque()
+        for passage_ids, texts in chunk_passages(passages):
+            pending.append((passage_ids, texts, pool.apply_async(encode_in_worker, (texts,))))
+            if len(pending) >= 2 * workers:
+                passage_ids, texts, result = pending.popleft()
+                yield passage_ids, texts, result.get()
+        while pending:
+            passage_ids, texts, result = pending.popleft()
+            yield passage_ids, texts, result.get()
+
+
+def write_metadata(f: TextIO, passage_ids: List[str], passages: List[str]):
+    """Append passage metadata rows in TSV format with a single write."""
+    f.write(''.join(
+        f"{passage_id}\t{passage_text.translate(TSV_ESCAPE_TABLE)}\n"
+        for passage_id, passage_text in zip(passage_ids, passages)
+    ))
+
+
+def write_chunks(
+    chunks: queue.Queue,
+    vectors_file: BinaryIO,
+    metadata_file: TextIO,
+    failed: threading.Event
+) -> int:
+    """Append (ids, texts, embeddings) items from the queue to the output files until a None sentinel.
     
-    num_vectors, dimension = embeddings.shape
+    The queue is always drained up to the sentinel so the producer never blocks;
+    on the first write error `failed` is set so the producer can stop encoding,
+    and the error is re-raised once draining finishes. Returns the number of
+    vectors written.
+    """
+    error = None
+    num_vectors = 0
+    while True:
+        item = chunks.get()
+        if item is None:
+            break
+        if error is not None:
+            continue
+        passage_ids, passages, embeddings = item
+        try:
+            np.ascontiguousarray(embeddings, dtype='<f4').tofile(vectors_file)
+            write_metadata(metadata_file, passage_ids, passages)
+            num_vectors += len(embeddings)
+        except Exception as e:
+            error = e
+            failed.set()
     
-    with open(output_path, 'wb') as f:
-        # Write header: [num_vectors: u32][dimension: u32]
-        f.write(struct.pack('<I', num_vectors))  # Little-endian uint32
-        f.write(struct.pack('<I', dimension))   # Little-endian uint32
+    if error is not None:
+        raise error
+    return num_vectors
+
+
+def generate_embeddings(
+    passages: Iterable[Tuple[str, str]],
+    vectors_path: str,
+    metadata_path: str,
+    model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+    batch_size: int = 128,
+    cache_dir: Optional[str] = None,
+    precision: str = "auto",
+    max_seq_length: Optional[int] = None,
+    normalize: bool = False,
+    workers: int = 1
+) -> Tuple[int, int]:
+    """Embed a stream of (passage_id, passage_text) pairs in a single pass.
+    
+    Vectors are appended to a DiskANN binary file whose header is patched once
+    the stream ends; metadata rows are written alongside. With workers > 1,
+    encoding runs in that many processes. Returns (num_vectors, dimension).
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if precision == "auto":
+        precision = "fp16" if device == "cuda" else "fp32"
+    print(f"Loading model: {model_name} (device: {device}, precision: {precision}, workers: {workers})")
+    if workers > 1:
+        # Workers load their own copies; this one only supplies model properties
+        model = load_model(model_name, "cpu", "fp32", max_seq_length)
+    else:
+        model = load_model(model_name, device, precision, max_seq_length)
+    dimension = model.get_sentence_embedding_dimension()
+    
+    # all-MiniLM-L6-v2 and similar models already end in a Normalize module
+    if normalize and isinstance(model[-1], Normalize):
+        print("Model output is already unit length; skipping extra normalization")
+        normalize = False
+    
+    token_cache_dir = None
+    if cache_dir:
+        # Tokens depend on the model's tokenizer and truncation length
+        cache_key = hashlib.sha256(f"{model_name}:{model.max_seq_length}".encode('utf-8')).hexdigest()
+        token_cache_dir = Path(cache_dir) / "tokens" / cache_key[:16]
+        token_cache_dir.mkdir(parents=True, exist_ok=True)
+        print(f"Using token cache: {token_cache_dir}")
+    
+    print(f"Saving binary vectors to {vectors_path}")
+    print(f"Saving metadata to {metadata_path}")
+    with open(vectors_path, 'wb', buffering=WRITE_BUFFER_SIZE) as vectors_file, \
+            open(metadata_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as metadata_file:
+        # Placeholder header: [num_vectors: u32][dimension: u32], patched below
+        vectors_file.write(VECTOR_HEADER.pack(0, dimension))
+        
+        print(f"Generating embeddings (batch size {batch_size})...")
+        # Overlap encoding with disk writes; the bounded queue caps buffered chunks
+        chunks = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        write_failed = threading.Event()
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            write_future = writer.submit(write_chunks, chunks, vectors_file, metadata_file, write_failed)
+            try:
+                if workers > 1:
+                    items = encode_chunks_parallel(
+                        passages, workers, device, model_name, precision, max_seq_length,
+                        batch_size, token_cache_dir, normalize
+                    )
+                else:
+                    items = encode_chunks(model, passages, batch_size, token_cache_dir, normalize)
+                for item in items:
+                    if write_failed.is_set():
+                        # Don't keep encoding (e.g. for hours on GPU) output that can't be saved
+                        items.close()
+                        break
+                    chunks.put(item)
+            finally:
+                chunks.put(None)
+            num_vectors = write_future.result()
         
-        # Write vectors as f32 values
-        for vector in tqdm(embeddings, desc="Writing vectors"):
-            for value in vector:
-                f.write(struct.pack('<f', float(value)))  # Little-endian float32
+        vectors_file.seek(0)
+        vectors_file.write(VECTOR_HEADER.pack(num_vectors, dimension))
     
     print(f"Saved {num_vectors} vectors of dimension {dimension}")
+    return num_vectors, dimension
+
+
+def map_vectors(vectors_path: str, shape: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """Memory-map the f32 payload of a DiskANN vector file as (num_vectors, dimension).
+    
+    Pass the shape when it is already known (e.g. from generate_embeddings)
+    to skip reading the header.
+    """
+    if shape is None:
+        with open(vectors_path, 'rb') as f:
+            shape = VECTOR_HEADER.unpack(f.read(VECTOR_HEADER.size))
+    num_vectors, dimension = shape
+    
+    if not num_vectors:
+        return np.empty((0, dimension), dtype='<f4')
+    return np.memmap(
+        vectors_path,
+        dtype='<f4',
+        mode='r',
+        offset=VECTOR_HEADER.size,
+        shape=(num_vectors, dimension)
+    )
+
+
+def quantize_vectors_int8(
+    vectors_path: str,
+    output_path: str,
+    scales_path: str,
+    shape: Optional[Tuple[int, int]] = None
+):
+    """Write an int8 copy of a DiskANN f32 vector file using per-dimension scales.
+    
+    The int8 file keeps the [num_vectors: u32][dimension: u32] header; the scales
+    needed to dequantize (value = q * scale) go to a JSON sidecar.
+    """
+    vectors = map_vectors(vectors_path, shape)
+    num_vectors, dimension = vectors.shape
+    
+    print(f"Quantizing {num_vectors} vectors to int8: {output_path}")
+    # First pass: per-dimension absolute maximum
+    max_abs = np.zeros(dimension, dtype=np.float32)
+    for start in range(0, num_vectors, QUANTIZE_CHUNK_SIZE):
+        chunk = vectors[start:start + QUANTIZE_CHUNK_SIZE]
+        np.maximum(max_abs, np.abs(chunk).max(axis=0), out=max_abs)
+    scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    
+    # Second pass: scale, round and write
+    with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(VECTOR_HEADER.pack(num_vectors, dimension))
+        for start in range(0, num_vectors, QUANTIZE_CHUNK_SIZE):
+            chunk = vectors[start:start + QUANTIZE_CHUNK_SIZE]
+            np.clip(np.round(chunk / scales), -127, 127).astype(np.int8).tofile(f)
+    
+    with open(scales_path, 'w', encoding='utf-8') as f:
+        json.dump({"dtype": "int8", "scales": scales.tolist()}, f)
+    
+    print(f"Saved int8 vectors and scales to {scales_path}")
 
 
-def save_metadata(passages: List[str], passage_ids: List[str], output_path: str):
-    """Save passage metadata in TSV format."""
-    print(f"Saving metadata to {output_path}")
+def quantize_vectors_binary(
+    vectors_path: str,
+    output_path: str,
+    shape: Optional[Tuple[int, int]] = None
+):
+    """Write a sign-bit copy of a DiskANN f32 vector file, packed 8 dimensions per byte.
+    
+    The header keeps the original [num_vectors: u32][dimension: u32]; each row
+    is then ceil(dimension / 8) bytes, most significant bit first. Suited to
+    Hamming-distance candidate generation with f32 re-ranking.
+    """
+    vectors = map_vectors(vectors_path, shape)
+    num_vectors, dimension = vectors.shape
     
-    with open(output_path, 'w', encoding='utf-8') as f:
-        for passage_id, passage_text in tqdm(zip(passage_ids, passages), desc="Writing metadata"):
-            # Escape tabs and newlines in the passage text
-            clean_text = passage_text.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
-            f.write(f"{passage_id}\t{clean_text}\n")
+    print(f"Quantizing {num_vectors} vectors to binary: {output_path}")
+    with open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(VECTOR_HEADER.pack(num_vectors, dimension))
+        for start in range(0, num_vectors, QUANTIZE_CHUNK_SIZE):
+            chunk = vectors[start:start + QUANTIZE_CHUNK_SIZE]
+            np.packbits(chunk > 0, axis=1).tofile(f)
     
-    print(f"Saved metadata for {len(passages)} passages")
+    print(f"Saved binary vectors to {output_path}")
 
 
 def main():
@@ -127,6 +536,48 @@ def main():
         default=None,
         help="Maximum number of passages to process (for testing)"
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=128,
+        help="Batch size for embedding inference"
+    )
+    parser.add_argument(
+        "--quantize",
+        choices=["none", "int8", "binary"],
+        default="none",
+        help="Also write a quantized copy of the vectors (f32 file is kept for index building)"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory for caching passage tokenization between runs"
+    )
+    parser.add_argument(
+        "--precision",
+        choices=["auto", "fp32", "fp16", "bf16"],
+        default="auto",
+        help="Inference precision (auto: fp16 on CUDA, fp32 on CPU); vectors are always saved as f32"
+    )
+    parser.add_argument(
+        "--max-seq-length",
+        type=int,
+        default=None,
+        help="Truncate passages to this many tokens (default: the model's own limit)"
+    )
+    parser.add_argument(
+        "--normalize",
+        action="store_true",
+        help="L2-normalize vectors so Euclidean search ranks by cosine similarity "
+             "(skipped when the model already normalizes its output)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Encoder processes (one model each; spread over GPUs, or over CPU cores)"
+    )
     
     args = parser.parse_args()
     
@@ -137,6 +588,9 @@ def main():
     # Output file paths
     vectors_path = output_dir / "msmarco_passages.bin"
     metadata_path = output_dir / "msmarco_passages.tsv"
+    int8_path = output_dir / "msmarco_passages.int8.bin"
+    scales_path = output_dir / "msmarco_passages.int8.json"
+    binary_path = output_dir / "msmarco_passages.binary.bin"
     
     # Check if files already exist
     if vectors_path.exists() and metadata_path.exists():
@@ -149,27 +603,39 @@ def main():
             return
     
     try:
-        # Download dataset
-        passages, passage_ids = download_msmarco_dataset()
-        
         # Limit passages if requested (for testing)
-        if args.max_passages and args.max_passages < len(passages):
+        if args.max_passages:
             print(f"Limiting to first {args.max_passages} passages for testing")
-            passages = passages[:args.max_passages]
-            passage_ids = passage_ids[:args.max_passages]
+        passages = tqdm(
+            stream_msmarco_passages(args.max_passages),
+            total=args.max_passages,
+            desc="Processing passages",
+            unit="passage"
+        )
         
-        # Generate embeddings
-        embeddings = generate_embeddings(passages, args.model)
+        # Stream passages through the encoder into the output files
+        num_vectors, dimension = generate_embeddings(
+            passages, str(vectors_path), str(metadata_path), args.model, args.batch_size,
+            args.cache_dir, args.precision, args.max_seq_length, args.normalize,
+            args.workers
+        )
         
-        # Save outputs
-        save_binary_vectors(embeddings, str(vectors_path))
-        save_metadata(passages, passage_ids, str(metadata_path))
+        if args.quantize == "int8":
+            quantize_vectors_int8(
+                str(vectors_path), str(int8_path), str(scales_path), (num_vectors, dimension)
+            )
+        elif args.quantize == "binary":
+            quantize_vectors_binary(str(vectors_path), str(binary_path), (num_vectors, dimension))
         
         print("\nSuccess! Generated files:")
         print(f"  Vectors: {vectors_path} ({vectors_path.stat().st_size:,} bytes)")
         print(f"  Metadata: {metadata_path} ({metadata_path.stat().st_size:,} bytes)")
-        print(f"  Vector count: {len(embeddings)}")
-        print(f"  Vector dimension: {embeddings.shape[1]}")
+        if args.quantize == "int8":
+            print(f"  Int8 vectors: {int8_path} ({int8_path.stat().st_size:,} bytes)")
+        elif args.quantize == "binary":
+            print(f"  Binary vectors: {binary_path} ({binary_path.stat().st_size:,} bytes)")
+        print(f"  Vector count: {num_vectors}")
+        print(f"  Vector dimension: {dimension}")
         
     except Exception as e:
         print(f"Error: {e}")
@@ -8,25 +8,35 @@ natural language queries to find relevant passages.
 
 Usage:
     python query_demo.py --index msmarco.disk.index --metadata msmarco_passages.tsv
+    python query_demo.py --index msmarco.disk.index --queries-file queries.txt
 """
 
 import argparse
+import collections
+import concurrent.futures
 import ctypes
+import ctypes.util
+import functools
+import mmap
+import os
+import shutil
 import struct
+import subprocess
 import sys
+import time
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional, Union
 
 try:
     import numpy as np
+    import torch
     from sentence_transformers import SentenceTransformer
 except ImportError as e:
     print(f"Missing dependency: {e}")
     print("Please install required packages:")
-    print("pip install sentence-transformers numpy")
+    print("pip install sentence-transformers torch numpy")
     sys.exit(1)
 
-
 # FFI Structures matching the Rust definitions
 class SearchResultC(ctypes.Structure):
     _fields_ = [
@@ -35,6 +45,83 @@ class SearchResultC(ctypes.Structure):
     ]
 
 
+# numpy view of a SearchResultC array
+RESULT_DTYPE = np.dtype([('id', '<u4'), ('distance', '<f4')])
+
+# Metadata sidecar record: [text_offset: u64][text_length: u32][passage_id: u32]
+METADATA_INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('id', '<u4')])
+
+# Queries scored per matrix multiply in exact (brute-force) search
+BRUTE_FORCE_QUERY_BLOCK = 256
+
+# Indexes up to this many vectors are searched exactly in-process instead of
+# through the CLI, which rebuilds the graph on every load
+EXACT_SEARCH_MAX_VECTORS = 50_000
+
+# Queries per block when encoding and searching a queries file in a pipeline
+QUERY_PIPELINE_BLOCK = 256
+
+# Number of distinct query strings whose embeddings are kept for reuse
+QUERY_CACHE_SIZE = 1024
+
+# Bytes of metadata TSV parsed per vectorized pass when building the sidecar
+METADATA_SCAN_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+# Release builds of the FFI library and CLI binary in this repository
+RELEASE_LIBRARY_PATH = Path(__file__).resolve().parent.parent / "DiskANNInRust" / "target" / "release" / "libdiskann_ffi.so"
+RELEASE_CLI_PATH = RELEASE_LIBRARY_PATH.with_name("diskann")
+
+# DiskANN vector file header: [num_vectors: u32][dimension: u32]
+VECTOR_HEADER = struct.Struct('<II')
+
+# `diskann serve` request header: [k: u32][beam_width: u32][dimension: u32]
+SERVE_REQUEST_HEADER = struct.Struct('<III')
+
+# Set in the request's dimension field when the query follows as float16
+SERVE_F16_FLAG = 1 << 31
+
+# Binary results (`diskann serve`, `diskann search --binary-output`), per query:
+# [count: u32] followed by count RESULT_DTYPE records
+RESULT_COUNT_HEADER = struct.Struct('<I')
+
+
+def find_ffi_library() -> Optional[str]:
+    """Locate the DiskANN FFI library: $DISKANN_FFI_LIB, the release build, then the system search path."""
+    return _find_ffi_library(os.environ.get("DISKANN_FFI_LIB"))
+
+
+@functools.lru_cache(maxsize=None)
+def _find_ffi_library(env_path: Optional[str]) -> Optional[str]:
+    # Cached per $DISKANN_FFI_LIB value, so the stat and linker search run once per process
+    if env_path:
+        return env_path
+    
+    try:
+        os.stat(RELEASE_LIBRARY_PATH)
+        return str(RELEASE_LIBRARY_PATH)
+    except FileNotFoundError:
+        return ctypes.util.find_library("diskann_ffi")
+
+
+def find_cli_binary() -> Optional[str]:
+    """Locate the diskann CLI: $DISKANN_BIN, the release build, then $PATH."""
+    return _find_cli_binary(os.environ.get("DISKANN_BIN"))
+
+
+@functools.lru_cache(maxsize=None)
+def _find_cli_binary(env_path: Optional[str]) -> Optional[str]:
+    # Cached per $DISKANN_BIN value, so the stat and $PATH walk run once per process
+    if env_path:
+        return env_path
+    
+    try:
+        os.stat(RELEASE_CLI_PATH)
+        return str(RELEASE_CLI_PATH)
+    except FileNotFoundError:
+        return shutil.which("diskann")
+
+
 class DiskAnnError(ctypes.c_int):
     SUCCESS = 0
     INVALID_ARGUMENT = 1
@@ -47,32 +134,27 @@ class DiskAnnError(ctypes.c_int):
 class DiskAnnFFI:
     """Wrapper for DiskANN FFI operations."""
     
-    def __init__(self, library_path: str = None):
-        """Load the DiskANN shared library."""
+    def __init__(self, library_path: str = None, max_k: int = 256):
+        """Load the DiskANN shared library and allocate search scratch buffers."""
         if library_path is None:
-            # Try to find the library in common locations
-            possible_paths = [
-                "./target/release/libdiskann_ffi.so",
-                "./target/debug/libdiskann_ffi.so", 
-                "./DiskANNInRust/target/release/libdiskann_ffi.so",
-                "./DiskANNInRust/target/debug/libdiskann_ffi.so",
-                "libdiskann_ffi.so"
-            ]
-            
-            library_path = None
-            for path in possible_paths:
-                if Path(path).exists():
-                    library_path = path
-                    break
-            
+            library_path = find_ffi_library()
             if library_path is None:
                 raise FileNotFoundError(
                     "Could not find DiskANN FFI library. Please build the library first:\n"
-                    "cd DiskANNInRust && cargo build --release"
+                    "cd DiskANNInRust && cargo build --release\n"
+                    "or point DISKANN_FFI_LIB at libdiskann_ffi.so"
                 )
         
         self.lib = ctypes.CDLL(library_path)
         self._setup_function_signatures()
+        
+        # Scratch buffers reused by every search() call
+        self._results = (SearchResultC * max_k)()
+        self._results_len = ctypes.c_uint()
+        self._results_len_ref = ctypes.byref(self._results_len)
+        
+        # Index paths already encoded for the C interface
+        self._path_cache: Dict[str, bytes] = {}
     
     def _setup_function_signatures(self):
         """Setup ctypes function signatures for FFI calls."""
@@ -102,40 +184,40 @@ class DiskAnnFFI:
     
     def load_index(self, index_path: str) -> ctypes.c_void_p:
         """Load index from file."""
-        return self.lib.diskann_load_index(index_path.encode('utf-8'))
+        encoded_path = self._path_cache.get(index_path)
+        if encoded_path is None:
+            encoded_path = self._path_cache[index_path] = index_path.encode('utf-8')
+        return self.lib.diskann_load_index(encoded_path)
     
     def search(self, handle: ctypes.c_void_p, query: np.ndarray, k: int = 10, beam_width: int = 64) -> List[Tuple[int, float]]:
         """Search for k nearest neighbors."""
         if handle == 0:
             raise ValueError("Invalid index handle")
         
-        # Prepare query array
-        query_array = (ctypes.c_float * len(query))(*query.astype(np.float32))
+        # Pass the numpy buffer directly; `query_array` keeps it alive across the call
+        query_array = np.ascontiguousarray(query, dtype=np.float32)
         
-        # Prepare results array
-        results_array = (SearchResultC * k)()
-        results_len = ctypes.c_uint()
+        # Grow the cached results buffer if this k doesn't fit
+        if k > len(self._results):
+            self._results = (SearchResultC * k)()
         
         # Call FFI function
         error = self.lib.diskann_search(
             handle,
-            query_array,
-            len(query),
+            query_array.ctypes.data_as(ctypes.POINTER(ctypes.c_float)),
+            len(query_array),
             k,
             beam_width,
-            results_array,
-            ctypes.byref(results_len)
+            self._results,
+            self._results_len_ref
         )
         
         if error != DiskAnnError.SUCCESS:
             raise RuntimeError(f"Search failed with error code: {error}")
         
-        # Convert results to Python list
-        results = []
-        for i in range(min(results_len.value, k)):
-            results.append((results_array[i].id, results_array[i].distance))
-        
-        return results
+        # Convert results to Python list in bulk through a structured view
+        results = np.frombuffer(self._results, dtype=RESULT_DTYPE, count=min(self._results_len.value, k))
+        return list(zip(results['id'].tolist(), results['distance'].tolist()))
     
     def destroy_index(self, handle: ctypes.c_void_p):
         """Clean up index handle."""
@@ -148,18 +230,636 @@ class DiskAnnFFI:
         return ctypes.string_at(version_ptr).decode('utf-8')
 
 
+class FfiIndex:
+    """An index loaded in-process through the FFI library."""
+    
+    def __init__(self, ffi: DiskAnnFFI, handle: int):
+        self.ffi = ffi
+        self.handle = handle
+    
+    def search(self, query: np.ndarray, k: int, beam_width: int) -> List[Tuple[int, float]]:
+        """Search for k nearest neighbors of one query."""
+        return self.ffi.search(self.handle, query, k, beam_width)
+    
+    def search_batch(self, queries: np.ndarray, k: int, beam_width: int) -> List[List[Tuple[int, float]]]:
+        """Search for k nearest neighbors of each query row."""
+        return [self.search(query, k, beam_width) for query in queries]
+    
+    def close(self):
+        """Release the index handle."""
+        self.ffi.destroy_index(self.handle)
+
+
+def parse_binary_results(data: bytes, num_queries: int) -> List[List[Tuple[int, float]]]:
+    """Split binary search output into per-query (id, distance) lists.
+    
+    Raises ValueError if the output is truncated or has trailing bytes.
+    """
+    results = []
+    offset = 0
+    for query_index in range(num_queries):
+        if offset + RESULT_COUNT_HEADER.size > len(data):
+            raise ValueError(f"search output ends before query {query_index}")
+        count, = RESULT_COUNT_HEADER.unpack_from(data, offset)
+        offset += RESULT_COUNT_HEADER.size
+        if offset + count * RESULT_DTYPE.itemsize > len(data):
+            raise ValueError(f"search output truncated in results for query {query_index}")
+        records = np.frombuffer(data, dtype=RESULT_DTYPE, count=count, offset=offset)
+        offset += records.nbytes
+        results.append(list(zip(records['id'].tolist(), records['distance'].tolist())))
+    
+    if offset != len(data):
+        raise ValueError(f"{len(data) - offset} unexpected bytes after {num_queries} query results")
+    return results
+
+
+class CliIndex:
+    """An index searched through the diskann command-line binary."""
+    
+    def __init__(self, index_path: str, binary_path: str):
+        self.index_path = index_path
+        self.binary_path = binary_path
+    
+    def search(self, query: np.ndarray, k: int, beam_width: int) -> List[Tuple[int, float]]:
+        """Search for k nearest neighbors of one query."""
+        return self.search_batch(query[np.newaxis, :], k, beam_width)[0]
+    
+    def search_batch(self, queries: np.ndarray, k: int, beam_width: int) -> List[List[Tuple[int, float]]]:
+        """Search every query row with a single CLI invocation."""
+        queries = np.ascontiguousarray(queries, dtype='<f4')
+        # Queries go over stdin ("-q -") as a vector file, not through a temp file
+        result = subprocess.run(
+            [
+                self.binary_path, "search",
+                "-i", self.index_path,
+                "-q", "-",
+                "-k", str(k),
+                "--beam", str(beam_width),
+                "--batch",
+                "--binary-output"
+            ],
+            input=b''.join((VECTOR_HEADER.pack(*queries.shape), memoryview(queries).cast('B'))),
+            capture_output=True
+        )
+        
+        if result.returncode != 0:
+            stderr = result.stderr.decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"diskann search failed: {stderr}")
+        return parse_binary_results(result.stdout, len(queries))
+    
+    def close(self):
+        """Nothing to release; each search runs in its own process."""
+
+
+def write_buffers(fd: int, buffers: List[Union[bytes, np.ndarray]]):
+    """Write all buffers to fd with writev: one syscall and no joined copy in the usual case."""
+    views = [memoryview(buffer).cast('B') for buffer in buffers]
+    while views:
+        written = os.writev(fd, views)
+        # Pipes may accept only part of a large request; resume where it stopped
+        while views and written >= len(views[0]):
+            written -= len(views[0])
+            views.pop(0)
+        if views:
+            views[0] = views[0][written:]
+
+
+class ServeIndex:
+    """An index held open by a long-lived `diskann serve` process."""
+    
+    def __init__(self, index_path: str, binary_path: str, half: bool = False):
+        # Sending float16 halves pipe traffic; each component rounds by under 0.05%
+        self.half = half
+        # Request header and wire-format query buffers, reused across searches
+        self._header = bytearray(SERVE_REQUEST_HEADER.size)
+        self._query = np.empty(0, dtype='<f2' if half else '<f4')
+        # The index is loaded once and kept resident; each request carries its own k and beam
+        self.proc = subprocess.Popen(
+            [binary_path, "serve", "-i", index_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            bufsize=0
+        )
+    
+    def _exited(self) -> RuntimeError:
+        """Reap the server after its pipe closed and describe how it ended."""
+        # poll() can run before the child is reaped and report None; wait() gets the real code,
+        # and the returncode it sets marks this searcher dead for later queries
+        return RuntimeError(
+            f"diskann serve exited with code {self.proc.wait()}; restart to search this index again"
+        )
+    
+    def _read_exact(self, size: int) -> bytes:
+        """Read exactly size bytes from the server."""
+        data = self.proc.stdout.read(size)
+        while len(data) < size:
+            chunk = self.proc.stdout.read(size - len(data))
+            if not chunk:
+                raise self._exited()
+            data += chunk
+        return data
+    
+    def search(self, query: np.ndarray, k: int, beam_width: int) -> List[Tuple[int, float]]:
+        """Search for k nearest neighbors of one query."""
+        if self.proc.returncode is not None:
+            raise self._exited()
+        
+        # QueryEncoder's contiguous float32 rows go out as they are; anything
+        # else is converted into the persistent buffer rather than a new array
+        if query.dtype != self._query.dtype or not query.flags.c_contiguous:
+            if len(self._query) != len(query):
+                self._query = np.empty(len(query), dtype=self._query.dtype)
+            np.copyto(self._query, query, casting='same_kind')
+            query = self._query
+        
+        dimension = len(query) | SERVE_F16_FLAG if self.half else len(query)
+        SERVE_REQUEST_HEADER.pack_into(self._header, 0, k, beam_width, dimension)
+        try:
+            write_buffers(self.proc.stdin.fileno(), [self._header, query])
+        except BrokenPipeError:
+            raise self._exited() from None
+        
+        count, = RESULT_COUNT_HEADER.unpack(self._read_exact(RESULT_COUNT_HEADER.size))
+        results = np.frombuffer(self._read_exact(count * RESULT_DTYPE.itemsize), dtype=RESULT_DTYPE)
+        return list(zip(results['id'].tolist(), results['distance'].tolist()))
+    
+    def search_batch(self, queries: np.ndarray, k: int, beam_width: int) -> List[List[Tuple[int, float]]]:
+        """Search for k nearest neighbors of each query row."""
+        return [self.search(query, k, beam_width) for query in queries]
+    
+    def close(self):
+        """Send the shutdown request and wait for the server to exit."""
+        try:
+            self.proc.stdin.write(SERVE_REQUEST_HEADER.pack(0, 0, 0))
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.proc.wait()
+        self.proc.stdout.close()
+
+
+def read_vector_header(vectors_path: str) -> Tuple[int, int]:
+    """Return (num_vectors, dimension) of a DiskANN vector file, checking its size."""
+    with open(vectors_path, 'rb') as f:
+        header = f.read(VECTOR_HEADER.size)
+        size = os.fstat(f.fileno()).st_size
+    if len(header) < VECTOR_HEADER.size:
+        raise ValueError(f"{vectors_path} is too short for a vector file header")
+    num_vectors, dimension = VECTOR_HEADER.unpack(header)
+    expected = VECTOR_HEADER.size + num_vectors * dimension * 4
+    if size != expected:
+        raise ValueError(
+            f"{vectors_path} holds {size} bytes, expected {expected} for "
+            f"{num_vectors} vectors of dimension {dimension}"
+        )
+    return num_vectors, dimension
+
+
+class BruteForceIndex:
+    """Exact search with numpy over a memory-mapped DiskANN vector file.
+    
+    The CLI's index file holds the raw vectors, so this serves small indexes
+    without a subprocess, and any index when neither the FFI library nor the
+    CLI is available to search it. Distances are Euclidean, as reported by the CLI.
+    """
+    
+    def __init__(self, vectors_path: str):
+        num_vectors, dimension = read_vector_header(vectors_path)
+        if num_vectors:
+            self.vectors = np.memmap(
+                vectors_path,
+                dtype='<f4',
+                mode='r',
+                offset=VECTOR_HEADER.size,
+                shape=(num_vectors, dimension)
+            )
+        else:
+            self.vectors = np.empty((0, dimension), dtype='<f4')
+        self._squared_norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+    
+    def search(self, query: np.ndarray, k: int, beam_width: int) -> List[Tuple[int, float]]:
+        """Search for the exact k nearest neighbors of one query."""
+        return self.search_batch(query[np.newaxis, :], k, beam_width)[0]
+    
+    def search_batch(self, queries: np.ndarray, k: int, beam_width: int) -> List[List[Tuple[int, float]]]:
+        """Search each query row exactly; beam_width has no effect."""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        k = min(k, len(self.vectors))
+        if k == 0:
+            return [[] for _ in queries]
+        
+        results = []
+        for start in range(0, len(queries), BRUTE_FORCE_QUERY_BLOCK):
+            block = queries[start:start + BRUTE_FORCE_QUERY_BLOCK]
+            # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2, one BLAS matmul per block
+            squared = block @ self.vectors.T
+            squared *= -2.0
+            squared += self._squared_norms
+            squared += np.einsum('ij,ij->i', block, block)[:, np.newaxis]
+            
+            # Select the k smallest per row, then sort just those
+            top = np.argpartition(squared, k - 1, axis=1)[:, :k]
+            top_squared = np.take_along_axis(squared, top, axis=1)
+            order = np.argsort(top_squared, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            distances = np.sqrt(np.maximum(np.take_along_axis(top_squared, order, axis=1), 0.0))
+            results.extend(
+                list(zip(ids.tolist(), dists.tolist())) for ids, dists in zip(top, distances)
+            )
+        return results
+    
+    def close(self):
+        """Nothing to release; the memory map closes with the object."""
+
+
+def load_query_model(
+    model_name: str,
+    backend: str = "torch",
+    onnx_file: Optional[str] = None,
+    threads: Optional[int] = None
+) -> SentenceTransformer:
+    """Load the query encoder on PyTorch (fp16 on CUDA) or ONNX Runtime.
+    
+    `onnx_file` selects an export inside the model repository, e.g. one of the
+    int8-quantized `onnx/model_q*int8_*.onnx` files all-MiniLM-L6-v2 publishes.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    return _load_query_model(model_name, backend, onnx_file)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_query_model(model_name: str, backend: str, onnx_file: Optional[str]) -> SentenceTransformer:
+    # Shared per (model, backend, export) so repeated loads reuse one set of weights
+    if backend == "onnx":
+        # Requires sentence-transformers>=3.2 installed with the [onnx] extra
+        model_kwargs = {"file_name": onnx_file} if onnx_file else None
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+    
+    model = SentenceTransformer(model_name).eval()
+    if model.device.type == "cuda":
+        model.half()
+    return model
+
+
+class QueryEncoder:
+    """Encodes query text, reusing embeddings of recently seen queries.
+    
+    Cache keys are the query with whitespace collapsed, and lowercased when the
+    model's tokenizer lowercases anyway, so trivially different spellings of a
+    query share one entry. Each encoder caches for its own model only.
+    """
+    
+    def __init__(self, model: SentenceTransformer, cache_size: int = QUERY_CACHE_SIZE):
+        self.model = model
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        # e.g. all-MiniLM-L6-v2's uncased WordPiece tokenizer
+        self._lowercase = bool(getattr(getattr(model, 'tokenizer', None), 'do_lower_case', False))
+    
+    def normalize(self, text: str) -> str:
+        """Return the cache key for a query; encoding it gives the same embedding as the original."""
+        key = " ".join(text.split())
+        return key.lower() if self._lowercase else key
+    
+    def _token_lengths(self, texts: List[str]) -> np.ndarray:
+        """Tokens per text (characters if the model exposes no tokenizer)."""
+        tokenizer = getattr(self.model, 'tokenizer', None)
+        if callable(tokenizer):
+            # One call into the (Rust) fast tokenizer for the whole list
+            input_ids = tokenizer(texts, add_special_tokens=False)['input_ids']
+            return np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(texts))
+        return np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    
+    def _encode_sorted(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Encode texts in batches of similar token length, returning f32 rows in input order.
+        
+        model.encode only sorts by character count, which tracks token count
+        loosely; grouping by tokens keeps padding within each batch minimal.
+        """
+        order = np.argsort(-self._token_lengths(texts), kind='stable')
+        embeddings = None
+        # No autograd bookkeeping: embeddings are never backpropagated through
+        with torch.inference_mode():
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                output = self.model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=batch_size,
+                    convert_to_numpy=True,
+                    normalize_embeddings=False,
+                    show_progress_bar=False
+                )
+                if embeddings is None:
+                    # f32 for the index even if the model runs in half precision
+                    embeddings = np.empty((len(texts), output.shape[1]), dtype=np.float32)
+                embeddings[batch] = output
+        return embeddings
+    
+    def encode(self, text: str) -> np.ndarray:
+        """Encode one query."""
+        return self.encode_many([text])[0]
+    
+    def encode_many(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Encode queries as f32 rows, running the model only over those not cached."""
+        keys = [self.normalize(text) for text in texts]
+        missing = [key for key in dict.fromkeys(keys) if key not in self._cache]
+        if missing:
+            embeddings = self._encode_sorted(missing, batch_size)
+            # Cached rows are handed out repeatedly, so keep them immutable
+            embeddings.setflags(write=False)
+            self._cache.update(zip(missing, embeddings))
+        
+        for key in keys:
+            self._cache.move_to_end(key)
+        result = np.stack([self._cache[key] for key in keys])
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+
+def is_passage_id(text: str) -> bool:
+    """Whether a TSV ID column is one MetadataIndex indexes: 1-10 ASCII digits fitting a u32."""
+    return 0 < len(text) <= 10 and text.isascii() and text.isdigit() and int(text) <= np.iinfo(np.uint32).max
+
+
 def load_metadata(metadata_path: str) -> Dict[str, str]:
-    """Load passage metadata from TSV file."""
-    metadata = {}
-    with open(metadata_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                parts = line.split('\t', 1)
-                if len(parts) == 2:
-                    passage_id, passage_text = parts
-                    metadata[passage_id] = passage_text
-    return metadata
+    """Load passage metadata from TSV file.
+    
+    Rows follow the same rule as index_metadata_lines: a line splits at its first
+    tab, the ID before it must be numeric, and the rest (stripped, possibly empty)
+    is the text.
+    """
+    # Only \n ends a line, as in the sidecar scan; a trailing \r is stripped with the text
+    with open(metadata_path, 'r', encoding='utf-8', newline='\n') as f:
+        rows = (line.split('\t', 1) for line in f)
+        return {
+            str(int(parts[0])): parts[1].strip()
+            for parts in rows
+            if len(parts) == 2 and is_passage_id(parts[0])
+        }
+
+
+def index_metadata_lines(block: Union[bytes, memoryview], base: int) -> np.ndarray:
+    """Locate `<id>\t<text>` records in whole TSV lines with numpy instead of a line loop.
+    
+    `block` starts at file offset `base` and ends at a line boundary (or EOF).
+    A line splits at its first tab; lines without a tab or whose ID isn't
+    1-10 digits fitting a u32 (see is_passage_id) are skipped. Text may be empty.
+    """
+    data = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero(data == ord('\n'))
+    if len(data) and data[-1] != ord('\n'):
+        ends = np.append(ends, len(data))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    
+    # First tab on each line
+    tabs = np.flatnonzero(data == ord('\t'))
+    if not len(tabs):
+        return np.empty(0, dtype=METADATA_INDEX_DTYPE)
+    first_tab = tabs[np.minimum(np.searchsorted(tabs, starts), len(tabs) - 1)]
+    id_lengths = first_tab - starts
+    valid = (first_tab >= starts) & (first_tab < ends) & (id_lengths > 0) & (id_lengths <= 10)
+    starts, ends, first_tab, id_lengths = starts[valid], ends[valid], first_tab[valid], id_lengths[valid]
+    
+    # Parse IDs one digit column at a time
+    ids = np.zeros(len(starts), dtype=np.uint64)
+    numeric = np.ones(len(starts), dtype=bool)
+    for column in range(int(id_lengths.max(initial=0))):
+        in_id = column < id_lengths
+        digits = data[np.where(in_id, starts + column, 0)] - np.uint8(ord('0'))
+        numeric &= ~in_id | (digits <= 9)
+        ids = np.where(in_id, ids * 10 + digits, ids)
+    numeric &= ids <= np.iinfo(np.uint32).max
+    
+    # Text runs from after the tab to the end of line, less any trailing \r
+    text_ends = ends - (data[np.maximum(ends - 1, 0)] == ord('\r'))
+    text_starts = first_tab + 1
+    
+    records = np.empty(int(numeric.sum()), dtype=METADATA_INDEX_DTYPE)
+    records['offset'] = base + text_starts[numeric]
+    records['length'] = np.maximum(text_ends - text_starts, 0)[numeric]
+    records['id'] = ids[numeric]
+    return records
+
+
+def build_metadata_index(data: Union[bytes, mmap.mmap]) -> np.ndarray:
+    """Scan a (memory-mapped) metadata TSV once for the byte span of every passage, sorted by ID.
+    
+    Chunks are views of the mapping cut at line boundaries, so nothing is copied.
+    """
+    parts = []
+    base = 0
+    with memoryview(data) as view:
+        while base < len(data):
+            # End each chunk just after the first newline at or past the chunk size
+            end = data.find(b'\n', min(base + METADATA_SCAN_CHUNK_SIZE, len(data)) - 1) + 1 or len(data)
+            parts.append(index_metadata_lines(view[base:end], base))
+            base = end
+    
+    index = np.concatenate(parts) if parts else np.empty(0, dtype=METADATA_INDEX_DTYPE)
+    index.sort(order='id')
+    return index
+
+
+class MetadataIndex:
+    """Lazy passage lookup over a memory-mapped metadata TSV.
+    
+    Only the `<metadata>.idx` sidecar is read up front (built on first use or when
+    the TSV is newer, and kept in memory if it can't be saved); passage text is
+    decoded when it is looked up.
+    """
+    
+    def __init__(self, metadata_path: str):
+        """Map the metadata file and load (building if stale) its sidecar index."""
+        metadata_path = Path(metadata_path)
+        if metadata_path.stat().st_size == 0:
+            self._mm = b''
+        else:
+            with open(metadata_path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        index_path = metadata_path.with_name(metadata_path.name + '.idx')
+        if index_path.exists() and index_path.stat().st_mtime >= metadata_path.stat().st_mtime:
+            index = np.fromfile(index_path, dtype=METADATA_INDEX_DTYPE)
+        else:
+            index = build_metadata_index(self._mm)
+            # Write then rename so an interrupted run never leaves a truncated sidecar
+            tmp_path = index_path.with_name(index_path.name + '.tmp')
+            try:
+                index.tofile(tmp_path)
+                os.replace(tmp_path, index_path)
+            except OSError as e:
+                # e.g. a read-only directory: the scan is still usable for this run
+                print(f"Warning: could not save metadata index ({e}), keeping it in memory")
+        
+        # Split the records into contiguous columns so bisection only touches IDs
+        self._ids = np.ascontiguousarray(index['id'])
+        self._offsets = np.ascontiguousarray(index['offset'])
+        self._lengths = np.ascontiguousarray(index['length'])
+        # With IDs 0..n-1 (as in MS MARCO) the ID is the row, so no search is needed
+        self._dense = np.array_equal(self._ids, np.arange(len(self._ids)))
+    
+    def __len__(self) -> int:
+        return len(self._ids)
+    
+    def get(self, passage_id: Union[int, str], default: Optional[str] = None) -> Optional[str]:
+        """Return the passage text for an ID, or `default` if it is unknown."""
+        try:
+            passage_id = int(passage_id)
+        except ValueError:
+            return default
+        
+        if self._dense:
+            pos = passage_id
+            if not 0 <= pos < len(self._ids):
+                return default
+        else:
+            pos = np.searchsorted(self._ids, passage_id)
+            if pos == len(self._ids) or self._ids[pos] != passage_id:
+                return default
+        
+        offset = int(self._offsets[pos])
+        length = int(self._lengths[pos])
+        return self._mm[offset:offset + length].decode('utf-8').strip()
+
+
+def open_metadata(metadata_path: str) -> 'Metadata':
+    """Open passage metadata lazily via its sidecar index, or load it eagerly if that fails.
+    
+    Results are shared between callers until the file's mtime or size changes.
+    """
+    stat = os.stat(metadata_path)
+    return _open_metadata(os.path.abspath(metadata_path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=8)
+def _open_metadata(metadata_path: str, mtime_ns: int, size: int) -> 'Metadata':
+    # mtime and size only key the cache, so an edited file is reopened
+    try:
+        return MetadataIndex(metadata_path)
+    except OSError as e:
+        # e.g. the TSV can't be memory-mapped
+        print(f"Warning: could not map metadata ({e}), loading it eagerly")
+        return load_metadata(metadata_path)
+
+
+# Either an eagerly loaded dict or a lazy MetadataIndex; both support .get(id, default)
+Metadata = Union[Dict[str, str], MetadataIndex]
+
+
+# Any search backend; each provides search, search_batch and close
+Searcher = Union[FfiIndex, CliIndex, ServeIndex, BruteForceIndex]
+
+
+def simulate_results(k: int) -> List[Tuple[int, float]]:
+    """Fixed results used in demo mode when no index is available."""
+    return [
+        (0, 0.1234),
+        (1, 0.2345), 
+        (2, 0.3456),
+        (3, 0.4567),
+        (4, 0.5678)
+    ][:k]
+
+
+def search_embedding(
+    searcher: Optional[Searcher],
+    query_embedding: np.ndarray,
+    k: int,
+    beam_width: int
+) -> List[Tuple[int, float]]:
+    """Search the index, or simulate results when running in demo mode."""
+    if searcher:
+        print("Searching index...")
+        return searcher.search(query_embedding, k, beam_width)
+    
+    # Demo mode - simulate results
+    print("Demo mode: simulating search results...")
+    return simulate_results(k)
+
+
+def display_results(results: List[Tuple[int, float]], metadata: Metadata):
+    """Print ranked search results with their passage text."""
+    print(f"\nTop {len(results)} results:")
+    print("-" * 80)
+    
+    for rank, (passage_id, distance) in enumerate(results, 1):
+        passage_text = metadata.get(str(passage_id), f"[No metadata for ID {passage_id}]")
+        
+        # Truncate long passages
+        if len(passage_text) > 200:
+            passage_text = passage_text[:197] + "..."
+        
+        print(f"{rank:2d}. ID: {passage_id:6d} | Distance: {distance:.4f}")
+        print(f"    {passage_text}")
+        print()
+
+
+def run_queries_file(
+    encoder: QueryEncoder,
+    searcher: Optional[Searcher],
+    metadata: Metadata,
+    queries_path: str,
+    k: int,
+    beam_width: int
+):
+    """Encode and search every distinct query in a file, in blocks.
+    
+    Encoding of the next block runs on a worker thread while the current block
+    is searched; both stages release the GIL, so their latencies overlap.
+    """
+    with open(queries_path, 'r', encoding='utf-8') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    if not queries:
+        print("No queries to run")
+        return
+    
+    # Repeated lines are encoded and searched once, then fanned back out
+    unique_queries, query_slots = np.unique(queries, return_inverse=True)
+    unique_queries = unique_queries.tolist()
+    
+    # Each CliIndex call is a process that rebuilds the graph, so search it in one block
+    block_size = len(unique_queries) if isinstance(searcher, CliIndex) else QUERY_PIPELINE_BLOCK
+    blocks = [unique_queries[start:start + block_size] for start in range(0, len(unique_queries), block_size)]
+    
+    def encode_block(block: List[str]) -> Tuple[np.ndarray, float]:
+        start = time.perf_counter()
+        embeddings = encoder.encode_many(block)
+        return embeddings, time.perf_counter() - start
+    
+    print(f"Encoding and searching {len(unique_queries)} distinct queries ({len(queries)} total)...")
+    if not searcher:
+        print("Demo mode: simulating search results...")
+    encode_seconds = search_seconds = 0.0
+    unique_results = []
+    wall_start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(encode_block, blocks[0])
+        for next_block in blocks[1:] + [None]:
+            query_embeddings, seconds = pending.result()
+            encode_seconds += seconds
+            if next_block is not None:
+                pending = executor.submit(encode_block, next_block)
+            
+            search_start = time.perf_counter()
+            if searcher:
+                unique_results.extend(searcher.search_batch(query_embeddings, k, beam_width))
+            else:
+                unique_results.extend(simulate_results(k) for _ in query_embeddings)
+            search_seconds += time.perf_counter() - search_start
+    wall_seconds = time.perf_counter() - wall_start
+    
+    # Report the phases separately; per-query figures are over distinct queries
+    per_query = 1000.0 / len(unique_queries)
+    print(f"Encode: {encode_seconds * 1000:.1f} ms ({encode_seconds * per_query:.2f} ms/query)")
+    print(f"Search: {search_seconds * 1000:.1f} ms ({search_seconds * per_query:.2f} ms/query)")
+    print(f"Total:  {wall_seconds * 1000:.1f} ms ({wall_seconds * per_query:.2f} ms/query, stages overlapped)")
+    
+    for query_text, slot in zip(queries, query_slots.tolist()):
+        results = unique_results[slot]
+        print(f"\nQuery: {query_text}")
+        display_results(results, metadata)
 
 
 def create_simple_demo_index(ffi: DiskAnnFFI) -> ctypes.c_void_p:
@@ -202,6 +902,22 @@ def main():
         default="sentence-transformers/all-MiniLM-L6-v2",
         help="Sentence transformer model for query encoding"
     )
+    parser.add_argument(
+        "--backend",
+        choices=["torch", "onnx"],
+        default="torch",
+        help="Inference backend for query encoding (onnx needs sentence-transformers[onnx])"
+    )
+    parser.add_argument(
+        "--onnx-file",
+        type=str,
+        help="ONNX export within the model repo, e.g. onnx/model_quint8_avx2.onnx for int8"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        help="PyTorch intra-op threads for query encoding (default: PyTorch's choice)"
+    )
     parser.add_argument(
         "--k",
         type=int,
@@ -214,31 +930,37 @@ def main():
         default=64,
         help="Beam width for search"
     )
+    parser.add_argument(
+        "--half-queries",
+        action="store_true",
+        help="Send queries to `diskann serve` as float16, halving pipe traffic"
+    )
     parser.add_argument(
         "--demo",
         action="store_true",
         help="Run in demo mode without requiring real index"
     )
+    parser.add_argument(
+        "--queries-file",
+        type=str,
+        help="File with one query per line; runs them in batch instead of interactively"
+    )
     
     args = parser.parse_args()
     
-    # Load sentence transformer for query encoding
-    print(f"Loading model: {args.model}")
-    model = SentenceTransformer(args.model)
-    
-    # Load metadata if available
-    metadata = {}
-    if args.metadata and Path(args.metadata).exists():
-        print(f"Loading metadata from {args.metadata}")
-        metadata = load_metadata(args.metadata)
-        print(f"Loaded metadata for {len(metadata)} passages")
-    
-    # Initialize FFI
+    # Initialize FFI before metadata indexing and the model load. Without it an
+    # existing index is still searched through the CLI or numpy fallbacks below,
+    # so only a run with neither an index nor --demo has nothing left to do.
+    has_index = bool(args.index) and Path(args.index).exists()
     try:
         ffi = DiskAnnFFI()
         print(f"DiskANN FFI version: {ffi.get_version()}")
     except Exception as e:
-        if args.demo:
+        if has_index:
+            print(f"Warning: Could not load FFI library ({e})")
+            print("Searching the index without the FFI layer")
+            ffi = None
+        elif args.demo:
             print(f"Warning: Could not load FFI library ({e})")
             print("Running in demo mode without actual search")
             ffi = None
@@ -247,16 +969,64 @@ def main():
             print("Build the library first: cd DiskANNInRust && cargo build --release")
             sys.exit(1)
     
+    # Load metadata if available
+    metadata = {}
+    if args.metadata and Path(args.metadata).exists():
+        print(f"Loading metadata from {args.metadata}")
+        metadata = open_metadata(args.metadata)
+        print(f"Loaded metadata for {len(metadata)} passages")
+    
+    # Load sentence transformer for query encoding
+    print(f"Loading model: {args.model} ({args.backend})")
+    model = load_query_model(args.model, args.backend, args.onnx_file, args.threads)
+    # Warm up so the first real query doesn't pay lazy initialization cost
+    model.encode(["warmup"], show_progress_bar=False)
+    encoder = QueryEncoder(model)
+    
     # Load or create index
-    index_handle = None
-    if args.index and Path(args.index).exists() and ffi:
+    searcher = None
+    if has_index:
         print(f"Loading index from {args.index}")
-        index_handle = ffi.load_index(args.index)
-        if index_handle == 0:
-            print("Warning: Failed to load index, using demo mode")
-            index_handle = None
+        index_handle = ffi.load_index(args.index) if ffi else 0
+        if index_handle:
+            searcher = FfiIndex(ffi, index_handle)
+        else:
+            # Fall back to the CLI when the FFI layer can't load the index:
+            # one batch run for a queries file, a resident server otherwise.
+            # Small indexes skip the subprocess and are searched exactly here.
+            try:
+                num_vectors, _ = read_vector_header(args.index)
+                cli_path = find_cli_binary()
+                if num_vectors <= EXACT_SEARCH_MAX_VECTORS:
+                    print(f"Searching {num_vectors} vectors exactly in-process")
+                    searcher = BruteForceIndex(args.index)
+                elif cli_path:
+                    print(f"FFI could not load the index, searching through {cli_path}")
+                    if args.queries_file:
+                        searcher = CliIndex(args.index, cli_path)
+                    else:
+                        searcher = ServeIndex(args.index, cli_path, half=args.half_queries)
+                else:
+                    print("Warning: no DiskANN backend could load the index, using exact numpy search")
+                    searcher = BruteForceIndex(args.index)
+            except (OSError, ValueError) as e:
+                # e.g. not a raw vector file; carry on without an index as demo mode does
+                print(f"Warning: could not open the index for search ({e})")
+                searcher = None
     elif args.demo and ffi:
         index_handle = create_simple_demo_index(ffi)
+        if index_handle:
+            searcher = FfiIndex(ffi, index_handle)
+    
+    if args.queries_file:
+        try:
+            run_queries_file(
+                encoder, searcher, metadata, args.queries_file, args.k, args.beam
+            )
+        finally:
+            if searcher:
+                searcher.close()
+        return
     
     print("\n" + "="*60)
     print("DiskANN Text Search Demo")
@@ -279,37 +1049,13 @@ def main():
             try:
                 # Encode query
                 print("Encoding query...")
-                query_embedding = model.encode([query_text], convert_to_numpy=True)[0]
+                query_embedding = encoder.encode(query_text)
                 
                 # Search
-                if ffi and index_handle:
-                    print("Searching index...")
-                    results = ffi.search(index_handle, query_embedding, args.k, args.beam)
-                else:
-                    # Demo mode - simulate results
-                    print("Demo mode: simulating search results...")
-                    results = [
-                        (0, 0.1234),
-                        (1, 0.2345), 
-                        (2, 0.3456),
-                        (3, 0.4567),
-                        (4, 0.5678)
-                    ][:args.k]
+                results = search_embedding(searcher, query_embedding, args.k, args.beam)
                 
                 # Display results
-                print(f"\nTop {len(results)} results:")
-                print("-" * 80)
-                
-                for rank, (passage_id, distance) in enumerate(results, 1):
-                    passage_text = metadata.get(str(passage_id), f"[No metadata for ID {passage_id}]")
-                    
-                    # Truncate long passages
-                    if len(passage_text) > 200:
-                        passage_text = passage_text[:197] + "..."
-                    
-                    print(f"{rank:2d}. ID: {passage_id:6d} | Distance: {distance:.4f}")
-                    print(f"    {passage_text}")
-                    print()
+                display_results(results, metadata)
                 
             except Exception as e:
                 print(f"Error processing query: {e}")
@@ -319,8 +1065,8 @@ def main():
     
     finally:
         # Cleanup
-        if ffi and index_handle:
-            ffi.destroy_index(index_handle)
+        if searcher:
+            searcher.close()
         print("Demo finished.")
 
 